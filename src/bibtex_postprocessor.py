@@ -6,21 +6,23 @@ import bibtexparser
 import click
 
 
-logging.basicConfig(level=logging.INFO, format="%(message)s")
 logger = logging.getLogger(__name__)
 
 # For click
 CONTEXT_SETTINGS = dict(help_option_names=["-h", "--help"])
 
+# Precompiled pattern for splitting titles into words
+_TITLE_WORDS = re.compile(r"[^:\"'`,\s]+")
 
-def read_bibtex(filepath: Path) -> bibtexparser.Library:
+# Article words skipped when building the title identifier
+_TITLE_ARTICLES = frozenset({"a", "an", "the"})
+
+
+def read_bibtex(filepath: str | Path) -> bibtexparser.Library:
     """
     Read bibtex file into a bibtexparser library.
     """
-    with open(filepath) as f:
-        bib_str = f.read()
-
-    library = bibtexparser.parse_string(bib_str)
+    library = bibtexparser.parse_file(str(filepath))
 
     if len(library.failed_blocks) > 0:
         logger.warning(
@@ -33,96 +35,172 @@ def read_bibtex(filepath: Path) -> bibtexparser.Library:
     return library
 
 
-def rename_entry_keys(library: bibtexparser.Library) -> bibtexparser.Library:
+def _first_author_surname(authors: str) -> str:
     """
-    For each entry in the library, grab the first author's surname, year, and the first word(s) from the title,
-    and combine them to generate a new key for that entry.
+    Return the first author's surname, i.e. everything before the first comma or whitespace.
+    """
+    surname = authors.split(",", 1)[0].split(None, 1)
+    return surname[0] if surname else ""
+
+
+def _remove_note(entry: bibtexparser.model.Entry):
+    """
+    Remove the 'note' field from an entry, if it has one.
+    """
+    try:
+        entry.pop("note")
+        logger.debug(f"Removed note from entry {entry.key}")
+    except KeyError:
+        pass
+
+
+def _add_braces_to_title(title_field: bibtexparser.model.Field):
+    """
+    Add curly braces around an entry's title field.
+    """
+    title_field.value = "{" + title_field.value + "}"
+
+
+def _release_suffix(next_suffix: dict[str, int], key: str):
+    """
+    If `key` is a numbered duplicate of a key in `next_suffix`, make its number available again.
+    """
+    # The base key can itself end in digits (e.g. the year), so try every split of the trailing digits
+    digits_start = len(key.rstrip("0123456789"))
+    for split in range(digits_start, len(key)):
+        if key[split] == "0":
+            continue
+        base = key[:split]
+        number = int(key[split:])
+        if 2 <= number < next_suffix.get(base, 0):
+            next_suffix[base] = number
+
+
+def _transform_entries(
+    library: bibtexparser.Library,
+    *,
+    remove_notes: bool = False,
+    preserve_titles: bool = False,
+) -> None:
     """
+    Rename the key of each entry in the library, and optionally remove its note and add braces around its title,
+    all in a single pass over the entries.
+    """
+    existing_keys = {entry.key for entry in library.entries}
+    # Lowest number that may be free for each duplicated key, so repeated collisions don't rescan from 2
+    next_suffix: dict[str, int] = {}
     for entry in library.entries:
-        try:
-            year = entry.fields_dict["year"].value
-            authors = entry.fields_dict["author"].value.lower()
-            first_author_surname = re.split("[,\s]", authors)[0]
-            title = entry.fields_dict["title"].value.lower()
-        except KeyError:
+        # Pick the needed fields in one pass over the entry, without building entry.fields_dict
+        year: str | None = None
+        authors: str | None = None
+        title_field: bibtexparser.model.Field | None = None
+        for field in entry.fields:
+            if field.key == "year":
+                year = field.value
+            elif field.key == "author":
+                authors = field.value
+            elif field.key == "title":
+                title_field = field
+        if year is None or authors is None or title_field is None:
             raise KeyError(
                 f"Missing information (year, author, or title) for entry {entry.key}"
             )
+        first_author_surname = _first_author_surname(authors).lower()
+        title = title_field.value
 
         # Take the first one to three words from the title. Discard article words.
-        split_title = re.split("[:\"'\`,\s]", title)
-        split_title = [part for part in split_title if part not in ["a", "an", "the"]]
-        title_identifier = ""
-        for part in split_title:
-            if len(title_identifier) > 2:
+        # Only the scanned words are lowercased, not the whole title.
+        title_parts = []
+        title_length = 0
+        for match in _TITLE_WORDS.finditer(title):
+            part = match.group().lower()
+            if part in _TITLE_ARTICLES:
+                continue
+            title_parts.append(part)
+            title_length += len(part)
+            if title_length > 2:
                 break
-            else:
-                title_identifier = title_identifier + part
+        title_identifier = "".join(title_parts)
         key_candidate = f"{first_author_surname}{year}{title_identifier}"
 
         # Check if key is already in use
-        library_keys = [entry.key for entry in library.entries]
-        if key_candidate in library_keys:
+        old_key = entry.key
+        if key_candidate in existing_keys:
             logger.debug(
                 f"Key '{key_candidate}' already exists in library. Appending entry key with a number."
             )
-            i = 2
-            while f"{key_candidate}{i}" in library_keys:
+            i = next_suffix.get(key_candidate, 2)
+            while f"{key_candidate}{i}" in existing_keys:
                 i += 1
+            next_suffix[key_candidate] = i + 1
             entry.key = f"{key_candidate}{i}"
         else:
             entry.key = key_candidate
-    return library
+        if old_key != entry.key:
+            existing_keys.discard(old_key)
+            _release_suffix(next_suffix, old_key)
+            existing_keys.add(entry.key)
+
+        if remove_notes:
+            _remove_note(entry)
+        if preserve_titles:
+            _add_braces_to_title(title_field)
+
+    if preserve_titles:
+        logger.debug("Modified titles to be encased in curly braces.")
+
+
+def rename_entry_keys(library: bibtexparser.Library) -> None:
+    """
+    For each entry in the library, grab the first author's surname, year, and the first word(s) from the title,
+    and combine them to generate a new key for that entry.
+    """
+    _transform_entries(library)
 
 
-def remove_note_field(library: bibtexparser.Library) -> bibtexparser.Library:
+def remove_note_field(library: bibtexparser.Library) -> None:
     """
     Remove the 'note' field from each entry. Prevents notes from passing into the final bibliography.
     """
     for entry in library.entries:
-        try:
-            entry.pop("note")
-            logger.debug(f"Removed note from entry {entry.key}")
-        except KeyError:
-            pass
+        _remove_note(entry)
 
-    return library
 
-
-def add_braces_to_title_field(library: bibtexparser.Library) -> bibtexparser.Library:
+def add_braces_to_title_field(library: bibtexparser.Library) -> None:
     """
     Add curly braces around all titles, preserving their capitalization.
     """
     for entry in library.entries:
         try:
-            entry.fields_dict["title"].value = (
-                "{" + entry.fields_dict["title"].value + "}"
-            )
+            _add_braces_to_title(entry.fields_dict["title"])
         except KeyError:
             pass
     logger.debug("Modified titles to be encased in curly braces.")
 
-    return library
 
-
-def write_bibtex(filepath: Path, library: bibtexparser.Library):
+def write_bibtex(filepath: str | Path, library: bibtexparser.Library):
     """
     Write bibtexparser library into a bibtex file. Remove extra spacing in front and between entries.
 
     Parameters:
-    - filepath (str): Filepath (with filename) of the new bibtex file.
+    - filepath (str | Path): Filepath (with filename) of the new bibtex file.
     - library (bibtexparser.Library): Library to write to file.
     """
     bibtex_format = bibtexparser.BibtexFormat()
     bibtex_format.block_separator = "\n"
     library_str = bibtexparser.write_string(library, bibtex_format=bibtex_format)
-    # Match first character that is not \ufeff or whitespace and remove everything before that
-    match = re.search(r"[^\ufeff|\s]", library_str)
-    if match:
-        library_str = library_str[match.start() :]
+    # Remove \ufeff and whitespace in front of the first entry, if there is any
+    start = 0
+    while start < len(library_str) and (
+        library_str[start] == "\ufeff" or library_str[start].isspace()
+    ):
+        start += 1
+    if start:
+        library_str = library_str[start:]
 
-    with open(filepath, "w") as f:
-        f.write(library_str)
+    data = library_str.encode("utf-8")
+    with open(filepath, "wb") as f:
+        f.write(data)
 
     logger.info(f"Wrote fixed bibliography to '{filepath}'")
 
@@ -134,11 +212,9 @@ def postprocess_bibtex(
     preserve_titles: bool = False,
 ):
     library = read_bibtex(filepath)
-    modded_library = rename_entry_keys(library)
-    if remove_notes:
-        modded_library = remove_note_field(modded_library)
-    if preserve_titles:
-        modded_library = add_braces_to_title_field(modded_library)
+    _transform_entries(
+        library, remove_notes=remove_notes, preserve_titles=preserve_titles
+    )
     if not new_filepath:
         # Ensure new file has '.bib' suffix and no whitespace
         new_filepath = filepath.parent / (filepath.stem.replace(" ", "_") + ".bib")
@@ -157,7 +233,7 @@ def postprocess_bibtex(
             logger.warning(
                 "The new filename has whitespace(s), it might not work with your LaTEx compiler."
             )
-    write_bibtex(new_filepath, modded_library)
+    write_bibtex(new_filepath, library)
 
 
 @click.command(context_settings=CONTEXT_SETTINGS)
@@ -182,6 +258,7 @@ def cli(bibtex_file, new_filename, remove_notes, preserve_titles):
     and write the result in a new file. The title identifier is the first one to three words of the title, exluding
     articles. Optionally remove notes and preserve capitalization in titles by adding {}.
     """
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
     bibtex_file = Path(bibtex_file)
     try:
         postprocess_bibtex(bibtex_file, new_filename, remove_notes, preserve_titles)
@@ -0,0 +1,44 @@
+import bibtexparser
+
+from bibtex_postprocessor import read_bibtex, rename_entry_keys, write_bibtex
+
+
+LIBRARY = """@article{x0, author = {Smith, John}, title = {Art and science}, year = {2020}}
+@article{x1, author = {Smith, John}, title = {The art of war}, year = {2020}}
+@article{x2, author = {Smith, Jane}, title = {Art: a history}, year = {2020}}
+@article{x3, author = {Doe, Jane}, title = {On things}, year = {2019}}
+"""
+
+
+def test_rename_entry_keys_on_own_output(tmp_path):
+    library = bibtexparser.parse_string(LIBRARY)
+    rename_entry_keys(library)
+    assert [entry.key for entry in library.entries] == [
+        "smith2020art",
+        "smith2020art2",
+        "smith2020art3",
+        "doe2019onthings",
+    ]
+
+    # Numbered keys freed by renames in the second pass are reused, lowest number first
+    bib_file = tmp_path / "library.bib"
+    write_bibtex(bib_file, library)
+    library = read_bibtex(bib_file)
+    rename_entry_keys(library)
+    assert [entry.key for entry in library.entries] == [
+        "smith2020art4",
+        "smith2020art",
+        "smith2020art2",
+        "doe2019onthings2",
+    ]
+
+
+def test_rename_entry_keys_never_reuses_suffix_below_two():
+    library = bibtexparser.parse_string(
+        """@article{a11, author = {A}, title = {1}, year = {}}
+@article{a12, author = {A}, title = {2}, year = {1}}
+@article{a1, author = {A}, title = {1}, year = {}}
+"""
+    )
+    rename_entry_keys(library)
+    assert [entry.key for entry in library.entries] == ["a13", "a122", "a12"]